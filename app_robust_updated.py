@@ -1,9 +1,5 @@
 import streamlit as st
 import pandas as pd
-import os
-import tempfile
-import shutil
-import time
 import traceback
 from pdf_extractor_robust import processar_pdf_com_markup
 
@@ -27,6 +23,14 @@ excel_file = st.file_uploader("Selecione o arquivo Excel com os preços", type=[
 # Definição do markup
 markup = st.number_input("Defina o valor do markup", min_value=1.0, max_value=10.0, value=2.0, step=0.1)
 
+# Qualidade (zoom de renderização) das imagens das páginas
+zoom = st.select_slider(
+    "Qualidade",
+    options=[1.0, 1.25, 1.5, 2.0],
+    value=1.5,
+    help="Valores maiores geram imagens mais nítidas, mas deixam o processamento mais lento e o arquivo maior."
+)
+
 # Seleção de cor para o rodapé
 st.subheader("Personalização")
 cor_option = st.selectbox(
@@ -101,69 +105,52 @@ if st.button("Gerar Catálogo com Preços"):
     else:
         with st.spinner("Processando... Isso pode levar alguns minutos."):
             try:
-                # Criar diretório temporário dedicado para este processamento
-                temp_dir = tempfile.mkdtemp(prefix="catalogo_")
-                
-                # Salvar os arquivos no diretório temporário
-                pdf_path = os.path.join(temp_dir, "catalogo.pdf")
-                excel_path = os.path.join(temp_dir, "precos.xlsx")
-                output_pdf_path = os.path.join(temp_dir, "catalogo_com_precos.pdf")
-                
-                # Salvar os arquivos de entrada
-                with open(pdf_path, "wb") as f:
-                    f.write(pdf_file.getvalue())
-                
-                with open(excel_path, "wb") as f:
-                    f.write(excel_file.getvalue())
-                
                 # Processar o PDF com tratamento de erros robusto
+                # (entradas e saída ficam em memória, sem arquivos temporários)
                 progress_bar = st.progress(0)
                 status_text = st.empty()
                 
+                # Atualizar a interface no máximo a cada 1% de progresso:
+                # cada atualização é uma ida e volta ao navegador
+                # (a atualização final, de 100%, é sempre exibida)
+                ultimo_percentual = [-1]
+                
                 def update_progress(message, percent):
-                    status_text.text(message)
-                    progress_bar.progress(percent)
+                    percentual = int(percent * 100)
+                    if percentual != ultimo_percentual[0] or percent >= 1.0:
+                        status_text.text(message)
+                        progress_bar.progress(percent)
+                        ultimo_percentual[0] = percentual
                 
                 # Processar o PDF
-                num_produtos = processar_pdf_com_markup(
-                    pdf_path, 
-                    excel_path, 
-                    output_pdf_path, 
-                    markup,
+                num_produtos, pdf_bytes = processar_pdf_com_markup(
+                    pdf_file.getvalue(), 
+                    excel_file.getvalue(), 
+                    markup=markup,
                     cor_tarja=cor_tarja,
-                    progress_callback=update_progress
+                    progress_callback=update_progress,
+                    zoom=zoom
                 )
                 
-                # Verificar se o arquivo de saída foi criado
-                if not os.path.exists(output_pdf_path):
-                    raise FileNotFoundError("O arquivo de saída não foi criado. Verifique os logs para mais detalhes.")
+                # Verificar se o PDF de saída foi gerado
+                if not pdf_bytes:
+                    raise ValueError("O arquivo de saída não foi criado. Verifique os logs para mais detalhes.")
                 
                 # Exibir resultado
                 st.success(f"{num_produtos} produtos processados com sucesso!")
                 
                 # Botão para download
-                with open(output_pdf_path, "rb") as file:
-                    btn = st.download_button(
-                        label="Baixar Catálogo com Preços",
-                        data=file,
-                        file_name="catalogo_com_precos.pdf",
-                        mime="application/pdf"
-                    )
+                btn = st.download_button(
+                    label="Baixar Catálogo com Preços",
+                    data=pdf_bytes,
+                    file_name="catalogo_com_precos.pdf",
+                    mime="application/pdf"
+                )
                 
             except Exception as e:
                 st.error(f"Ocorreu um erro: {str(e)}")
                 st.error("Detalhes do erro:")
                 st.code(traceback.format_exc())
-            
-            finally:
-                # Limpar arquivos temporários de forma segura
-                try:
-                    if 'temp_dir' in locals():
-                        # Aguardar um momento para garantir que todos os processos terminaram
-                        time.sleep(1)
-                        shutil.rmtree(temp_dir, ignore_errors=True)
-                except Exception as cleanup_error:
-                    st.warning(f"Aviso: Não foi possível limpar todos os arquivos temporários. {str(cleanup_error)}")
 
 # Adicionar informações sobre o aplicativo
 st.markdown("---")
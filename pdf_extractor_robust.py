@@ -9,157 +9,294 @@ import io
 import time
 import traceback
 import sys
-import shutil
+import functools
+import multiprocessing
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import logging
 
-def extrair_imagens_pdf(pdf_path, output_dir, progress_callback=None):
+logger = logging.getLogger(__name__)
+
+# Leitor de Excel: calamine (em Rust, bem mais rápido) quando disponível,
+# senão o padrão do pandas (openpyxl)
+try:
+    import python_calamine  # noqa: F401
+    _EXCEL_ENGINE = 'calamine'
+except ImportError:
+    _EXCEL_ENGINE = None
+
+# Palavras-chave que precedem os códigos de produtos
+_KEYWORDS = (
+    'CONJUNTO',  # Padrão para "CONJUNTO 85274"
+    'BERMUDA',   # Padrão para "BERMUDA 84216"
+    'CAMISA',    # Padrão para "CAMISA 84831"
+    'CAMISETA',  # Padrão para "CAMISETA 84218"
+    'BONE',      # Padrão para "BONE 82969"
+    'BONÉ',      # Padrão para "BONÉ 82969" (com acento)
+    'BLUSA',     # Padrão para "BLUSA 85640"
+    'SAIA',      # Padrão para "SAIA 86130"
+    'VESTIDO',   # Padrão para "VESTIDO 86065"
+    'MACACÃO',   # Padrão para "MACACÃO 83844"
+    'JAQUETA',   # Padrão para "JAQUETA 85109"
+    'BODY',      # Padrão para "BODY 84291"
+    'CALÇA',     # Padrão para "CALÇA 84522"
+    'LENÇO',     # Padrão para "LENÇO 84486"
+    'ÓCULOS',    # Padrão para "ÓCULOS 8585827"
+)
+
+# Padrões compilados uma única vez: todas as palavras-chave em uma alternância
+_CODE_RE = re.compile(r'(' + '|'.join(_KEYWORDS) + r')\s+(\d{5})', re.IGNORECASE)
+
+# Padrão genérico para encontrar qualquer código de 5 dígitos
+_GENERIC_RE = re.compile(r'\b(\d{5})\b')
+
+def _localizar_fonte():
     """
-    Extrai apenas as imagens do PDF, ignorando completamente a camada de texto.
+    Procura uma fonte TrueType equivalente à Arial instalada no sistema.
     
-    Args:
-        pdf_path: Caminho para o arquivo PDF
-        output_dir: Diretório onde as imagens serão salvas
-        progress_callback: Função para reportar progresso
-        
     Returns:
-        Lista de caminhos para as imagens extraídas
+        Caminho para a fonte encontrada, ou None para usar a fonte padrão
     """
-    # Criar diretório de saída se não existir
-    os.makedirs(output_dir, exist_ok=True)
+    # Verificar se a fonte Arial está disponível
+    fontes = [
+        '/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf',
+        # Fontes alternativas
+        '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+        '/usr/share/fonts/truetype/freefont/FreeSans.ttf',
+        '/usr/share/fonts/truetype/ubuntu/Ubuntu-R.ttf'
+    ]
     
-    # Abrir o PDF com tratamento de erros
-    try:
-        doc = fitz.open(pdf_path)
-    except Exception as e:
-        raise Exception(f"Erro ao abrir o arquivo PDF: {str(e)}")
+    for fonte in fontes:
+        if os.path.exists(fonte):
+            return fonte
     
-    imagens_paths = []
-    total_pages = len(doc)
+    # Se nenhuma fonte for encontrada, usar a fonte padrão
+    return None
+
+# Fonte localizada uma única vez, na importação do módulo
+FONTE_PATH = _localizar_fonte()
+
+# Zoom para o qual o layout do rodapé (tarja, fonte e posições) foi definido.
+# As páginas do PDF final sempre têm o tamanho correspondente a este zoom;
+# renderizar com um zoom menor apenas reduz a resolução das imagens.
+ZOOM_LAYOUT = 2
+
+# Zoom padrão de renderização das páginas
+ZOOM_PADRAO = 1.5
+
+def _extrair_codigos_texto(texto, page_num):
+    """
+    Extrai códigos de produtos do texto de uma página.
     
-    # Para cada página
-    for page_num in range(total_pages):
-        if progress_callback:
-            progress_callback(f"Extraindo imagem da página {page_num+1} de {total_pages}...", 
-                             (page_num / total_pages) * 0.3)  # 30% do progresso total
+    Args:
+        texto: Texto extraído da página
+        page_num: Índice da página (começando em 0)
         
-        try:
-            # Renderizar a página como imagem em alta resolução
-            page = doc[page_num]
-            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))  # Aumentar resolução para melhor qualidade
-            
-            # Salvar a imagem
-            img_path = os.path.join(output_dir, f"page_{page_num+1}.png")
-            pix.save(img_path)
+    Returns:
+        Lista de códigos de produtos encontrados na página
+    """
+    codigos = []
+    encontrou_especifico = False
+    
+    # Verificar padrões específicos (uma única varredura do texto)
+    for match in _CODE_RE.finditer(texto):
+        encontrou_especifico = True
+        codigo = match.group(2)
+        texto_completo = match.group(0)
+        
+        codigos.append({
+            'pagina': page_num,
+            'codigo': codigo,
+            'texto_completo': texto_completo,
+            'posicao_y': page_num  # Simplificado para usar apenas o número da página como referência
+        })
+    
+    # Se não encontrou com padrões específicos, tentar padrão genérico
+    if not encontrou_especifico:
+        for match in _GENERIC_RE.finditer(texto):
+            codigo = match.group(1)
             
-            imagens_paths.append({
+            codigos.append({
                 'pagina': page_num,
-                'caminho': img_path
+                'codigo': codigo,
+                'texto_completo': codigo,
+                'posicao_y': page_num  # Simplificado para usar apenas o número da página como referência
             })
-        except Exception as e:
-            print(f"Erro ao processar página {page_num+1}: {str(e)}")
-            # Continuar com a próxima página em vez de falhar completamente
-            continue
-    
-    doc.close()
     
-    return imagens_paths
+    return codigos
 
-def extrair_codigos_produtos(pdf_path, progress_callback=None):
+def _abrir_pdf(pdf):
     """
-    Extrai códigos de produtos do PDF para referência.
+    Abre um PDF a partir de um caminho ou diretamente dos bytes do arquivo.
     
     Args:
-        pdf_path: Caminho para o arquivo PDF
-        progress_callback: Função para reportar progresso
+        pdf: Caminho para o arquivo PDF ou seu conteúdo em bytes
         
     Returns:
-        Lista de códigos de produtos com suas páginas
+        Documento PyMuPDF aberto
     """
-    codigos = []
+    if isinstance(pdf, (bytes, bytearray)):
+        return fitz.open(stream=pdf, filetype='pdf')
+    return fitz.open(pdf)
+
+# Documento aberto em cada processo do pool (ver _inicializar_worker)
+_doc_worker = None
+_paginas_worker = 0
+
+# A cada quantas páginas cada worker esvazia o cache interno do MuPDF
+_PAGINAS_POR_LIMPEZA = 20
+
+def _inicializar_worker(pdf):
+    """
+    Abre o PDF uma única vez em cada processo do pool.
     
-    # Padrões para encontrar códigos de produtos
-    padroes = [
-        r'CONJUNTO\s+(\d{5})',  # Padrão para "CONJUNTO 85274"
-        r'BERMUDA\s+(\d{5})',   # Padrão para "BERMUDA 84216"
-        r'CAMISA\s+(\d{5})',    # Padrão para "CAMISA 84831"
-        r'CAMISETA\s+(\d{5})',  # Padrão para "CAMISETA 84218"
-        r'BONE\s+(\d{5})',      # Padrão para "BONE 82969"
-        r'BONÉ\s+(\d{5})',      # Padrão para "BONÉ 82969" (com acento)
-        r'BLUSA\s+(\d{5})',     # Padrão para "BLUSA 85640"
-        r'SAIA\s+(\d{5})',      # Padrão para "SAIA 86130"
-        r'VESTIDO\s+(\d{5})',   # Padrão para "VESTIDO 86065"
-        r'MACACÃO\s+(\d{5})',   # Padrão para "MACACÃO 83844"
-        r'JAQUETA\s+(\d{5})',   # Padrão para "JAQUETA 85109"
-        r'BODY\s+(\d{5})',      # Padrão para "BODY 84291"
-        r'CALÇA\s+(\d{5})',     # Padrão para "CALÇA 84522"
-        r'LENÇO\s+(\d{5})',     # Padrão para "LENÇO 84486"
-        r'ÓCULOS\s+(\d{5})'     # Padrão para "ÓCULOS 8585827"
-    ]
+    Objetos do MuPDF não podem ser compartilhados entre processos, então
+    cada worker mantém seu próprio documento aberto para todas as páginas
+    que processar. Os bytes do PDF são enviados uma vez por worker, e não
+    uma vez por página.
     
-    # Padrão genérico para encontrar qualquer código de 5 dígitos
-    padrao_generico = r'\b(\d{5})\b'
+    Args:
+        pdf: Caminho para o arquivo PDF ou seu conteúdo em bytes
+    """
+    global _doc_worker
     
+    # Avisos do MuPDF sobre PDFs malformados não precisam ir para o terminal
+    fitz.TOOLS.mupdf_display_errors(False)
+    
+    _doc_worker = _abrir_pdf(pdf)
+
+def _processar_pagina(page_num, zoom=ZOOM_PADRAO):
+    """
+    Renderiza uma página do PDF e extrai seus códigos de produtos.
+    
+    Executada em um processo do pool, sobre o documento aberto por
+    _inicializar_worker. Imagem e texto são obtidos da mesma página aberta,
+    evitando percorrer o PDF duas vezes. A imagem é devolvida como bytes RGB
+    brutos, sem passar por um arquivo PNG intermediário.
+    
+    Args:
+        page_num: Índice da página (começando em 0)
+        zoom: Fator de ampliação da renderização
+        
+    Returns:
+        Tupla (informações da imagem, lista de códigos da página)
+    """
+    global _paginas_worker
+    
+    # Limitar o crescimento do cache do MuPDF em documentos grandes
+    _paginas_worker += 1
+    if _paginas_worker % _PAGINAS_POR_LIMPEZA == 0:
+        fitz.TOOLS.store_shrink(100)
+    
+    page = _doc_worker[page_num]
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)  # Aumentar resolução para melhor qualidade
+    
+    imagem = {
+        'pagina': page_num,
+        'largura': pix.width,
+        'altura': pix.height,
+        'zoom': zoom,
+        'amostras': bytes(pix.samples)
+    }
+    
+    # A capa não recebe tarja nem preços: não há códigos a extrair
+    if page_num == 0:
+        return imagem, []
+    
+    # Uma falha na extração de códigos perde apenas os preços da página,
+    # não a sua imagem
+    try:
+        # Extrair texto (o modo "text" já não coleta imagens)
+        texto = page.get_text("text")
+        codigos = _extrair_codigos_texto(texto, page_num)
+    except Exception as e:
+        logger.warning("Erro ao extrair códigos da página %d: %s", page_num + 1, e)
+        return imagem, []
+    
+    return imagem, codigos
+
+def contar_paginas(pdf):
+    """
+    Conta as páginas de um PDF.
+    
+    Args:
+        pdf: Caminho para o arquivo PDF ou seu conteúdo em bytes
+        
+    Returns:
+        Número de páginas do PDF
+    """
     # Abrir o PDF com tratamento de erros
     try:
-        doc = fitz.open(pdf_path)
+        doc = _abrir_pdf(pdf)
+        total_pages = len(doc)
+        doc.close()
     except Exception as e:
-        raise Exception(f"Erro ao abrir o arquivo PDF para extração de códigos: {str(e)}")
+        raise Exception(f"Erro ao abrir o arquivo PDF: {str(e)}")
+    
+    return total_pages
+
+def extrair_paginas(pdf, num_workers=None, zoom=ZOOM_PADRAO, total_paginas=None):
+    """
+    Extrai as imagens e os códigos de produtos do PDF em uma única passagem.
+    As imagens ignoram completamente a camada de texto, que é usada apenas
+    para localizar os códigos. As páginas são processadas em paralelo, em um
+    pool de processos, e entregues em ordem assim que ficam prontas.
     
-    total_pages = len(doc)
+    O número de páginas em processamento é limitado, de modo que, se quem
+    consome as páginas for mais lento, a extração espera em vez de acumular
+    todas as imagens em memória.
     
-    # Para cada página
-    for page_num in range(total_pages):
-        if progress_callback:
-            progress_callback(f"Extraindo códigos da página {page_num+1} de {total_pages}...", 
-                             0.3 + (page_num / total_pages) * 0.2)  # 30-50% do progresso total
+    Args:
+        pdf: Caminho para o arquivo PDF ou seu conteúdo em bytes
+        num_workers: Número de processos (padrão: número de CPUs, até 4)
+        zoom: Fator de ampliação da renderização (qualidade das imagens)
+        total_paginas: Número de páginas do PDF, se já conhecido (evita abri-lo novamente)
         
-        try:
-            # Obter a página
-            page = doc[page_num]
+    Yields:
+        Tuplas (imagem RGB da página, lista de códigos de produtos da página)
+    """
+    total_pages = total_paginas if total_paginas is not None else contar_paginas(pdf)
+    
+    if num_workers is None:
+        num_workers = min(os.cpu_count() or 1, 4)
+    
+    max_pendentes = num_workers * 2
+    
+    # Os workers não são criados por fork: a extração pode rodar em uma thread
+    # secundária de um processo com várias threads (como o servidor do
+    # Streamlit), e um fork nessa situação pode travar os processos filhos
+    metodo = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context(metodo),
+                             initializer=_inicializar_worker, initargs=(pdf,)) as executor:
+        pendentes = deque()
+        proxima_pagina = 0
+        
+        while pendentes or proxima_pagina < total_pages:
+            # Manter o pool ocupado, sem ultrapassar o limite de páginas pendentes
+            while proxima_pagina < total_pages and len(pendentes) < max_pendentes:
+                pendentes.append((proxima_pagina, executor.submit(_processar_pagina, proxima_pagina, zoom)))
+                proxima_pagina += 1
             
-            # Extrair texto
-            texto = page.get_text()
+            page_num, future = pendentes.popleft()
             
-            # Verificar padrões específicos
-            for padrao in padroes:
-                matches = re.finditer(padrao, texto, re.IGNORECASE)
-                for match in matches:
-                    codigo = match.group(1)
-                    texto_completo = match.group(0)
-                    
-                    codigos.append({
-                        'pagina': page_num,
-                        'codigo': codigo,
-                        'texto_completo': texto_completo,
-                        'posicao_y': page_num  # Simplificado para usar apenas o número da página como referência
-                    })
+            try:
+                resultado = future.result()
+            except Exception as e:
+                logger.exception("Erro ao processar página %d; a página foi omitida do catálogo: %s", page_num + 1, e)
+                # Continuar com a próxima página em vez de falhar completamente
+                continue
             
-            # Se não encontrou com padrões específicos, tentar padrão genérico
-            if not any(codigo['pagina'] == page_num for codigo in codigos):
-                matches = re.finditer(padrao_generico, texto)
-                for match in matches:
-                    codigo = match.group(1)
-                    
-                    codigos.append({
-                        'pagina': page_num,
-                        'codigo': codigo,
-                        'texto_completo': codigo,
-                        'posicao_y': page_num  # Simplificado para usar apenas o número da página como referência
-                    })
-        except Exception as e:
-            print(f"Erro ao extrair códigos da página {page_num+1}: {str(e)}")
-            # Continuar com a próxima página em vez de falhar completamente
-            continue
-    
-    doc.close()
-    
-    return codigos
+            yield resultado
 
 def ler_excel_precos(caminho_arquivo, markup=2.0, progress_callback=None):
     """
     Lê um arquivo Excel contendo informações de produtos e preços e aplica o markup.
     
     Args:
-        caminho_arquivo: Caminho para o arquivo Excel
+        caminho_arquivo: Caminho para o arquivo Excel ou seu conteúdo em bytes
         markup: Valor do markup a ser aplicado (ex: 2.0 para 100% de markup)
         progress_callback: Função para reportar progresso
         
@@ -167,11 +304,21 @@ def ler_excel_precos(caminho_arquivo, markup=2.0, progress_callback=None):
         Um dicionário com códigos de produtos como chaves e informações de preço como valores
     """
     if progress_callback:
-        progress_callback("Lendo arquivo Excel de preços...", 0.5)  # 50% do progresso total
+        progress_callback("Lendo arquivo Excel de preços...", 0.05)  # 5% do progresso total
     
     try:
-        # Ler o arquivo Excel
-        df = pd.read_excel(caminho_arquivo)
+        # Ler o arquivo Excel (diretamente da memória, se recebido em bytes)
+        if isinstance(caminho_arquivo, (bytes, bytearray)):
+            caminho_arquivo = io.BytesIO(caminho_arquivo)
+        try:
+            df = pd.read_excel(caminho_arquivo, engine=_EXCEL_ENGINE)
+        except ValueError as e:
+            # Versões do pandas anteriores à 2.2 não conhecem o calamine
+            if _EXCEL_ENGINE is None or 'Unknown engine' not in str(e):
+                raise
+            if hasattr(caminho_arquivo, 'seek'):
+                caminho_arquivo.seek(0)
+            df = pd.read_excel(caminho_arquivo)
         
         # Verificar se as colunas necessárias existem
         if len(df.columns) < 3:
@@ -194,48 +341,40 @@ def ler_excel_precos(caminho_arquivo, markup=2.0, progress_callback=None):
         if isinstance(df['referencia'].iloc[0], str) and not df['referencia'].iloc[0].isdigit():
             df = df.iloc[1:].reset_index(drop=True)
         
-        # Converter para dicionário de produtos
-        produtos_dict = {}
+        # Descartar linhas sem referência ou sem preço
+        df = df.dropna(subset=['referencia', 'preco_custo'])
         
-        for _, row in df.iterrows():
-            # Verificar se a linha tem valores válidos
-            if pd.notna(row['referencia']) and pd.notna(row['preco_custo']):
-                try:
-                    # Verificar se o valor é uma string que contém "VALOR" (cabeçalho)
-                    if isinstance(row['preco_custo'], str) and "VALOR" in row['preco_custo'].upper():
-                        continue
-                    
-                    # Converter preço para float
-                    if isinstance(row['preco_custo'], str):
-                        preco_custo = float(row['preco_custo'].replace(',', '.'))
-                    else:
-                        preco_custo = float(row['preco_custo'])
-                    
-                    # Calcular preço de venda com markup
-                    preco_venda = preco_custo * markup
-                    
-                    # Usar o código como chave no dicionário
-                    if isinstance(row['referencia'], (int, float)):
-                        codigo = str(int(row['referencia']))  # Converter para inteiro e depois para string para remover decimais
-                    else:
-                        # Tentar extrair apenas os dígitos se for uma string
-                        codigo_match = re.search(r'(\d+)', str(row['referencia']))
-                        if codigo_match:
-                            codigo = codigo_match.group(1)
-                        else:
-                            continue  # Pular se não conseguir extrair um código numérico
-                    
-                    produtos_dict[codigo] = {
-                        'tamanho': str(row['tamanho']) if pd.notna(row['tamanho']) else "",
-                        'preco_custo': preco_custo,
-                        'preco_venda': preco_venda
-                    }
-                except (ValueError, TypeError) as e:
-                    # Pular linhas com valores não numéricos
-                    print(f"Erro ao processar linha do Excel: {str(e)}")
-                    continue
-        
-        print(f"Produtos carregados: {len(produtos_dict)}")
+        # Converter preço para float (valores não numéricos, como o cabeçalho "VALOR", viram NaN)
+        df['preco_custo'] = pd.to_numeric(
+            df['preco_custo'].astype(str).str.replace(',', '.', regex=False),
+            errors='coerce'
+        )
+        
+        # Extrair apenas os dígitos da referência para usar como código
+        # (referências numéricas como 84216.0 resultam em "84216")
+        df['codigo'] = df['referencia'].astype(str).str.extract(r'(\d+)', expand=False)
+        
+        # Pular linhas com valores não numéricos
+        df = df.dropna(subset=['preco_custo', 'codigo'])
+        
+        # Calcular preço de venda com markup
+        df['preco_venda'] = df['preco_custo'] * markup
+        
+        # Arredondar todos os preços para terminar em 7 de uma só vez
+        # (mesma regra de arredondar_preco_para_terminar_em_7)
+        preco_inteiro = df['preco_venda'].astype(np.int64)
+        df['preco_arredondado'] = preco_inteiro - ((preco_inteiro - 7) % 10)
+        
+        df['tamanho'] = df['tamanho'].fillna('').astype(str)
+        
+        # Converter para dicionário de produtos (a última ocorrência de cada código prevalece)
+        produtos_dict = (
+            df.drop_duplicates(subset='codigo', keep='last')
+              .set_index('codigo')[['tamanho', 'preco_custo', 'preco_venda', 'preco_arredondado']]
+              .to_dict('index')
+        )
+        
+        logger.info("Produtos carregados: %d", len(produtos_dict))
         return produtos_dict
     except Exception as e:
         raise Exception(f"Erro ao ler o arquivo Excel: {str(e)}")
@@ -253,270 +392,334 @@ def arredondar_preco_para_terminar_em_7(preco):
     # Arredondar para baixo para o inteiro mais próximo
     preco_inteiro = int(preco)
     
-    # Calcular o último dígito
-    ultimo_digito = preco_inteiro % 10
-    
-    # Se o último dígito já é 7, manter o valor
-    if ultimo_digito == 7:
-        return preco_inteiro
+    # Recuar até o número terminado em 7 mais próximo (sem desvios condicionais)
+    return preco_inteiro - ((preco_inteiro - 7) % 10)
+
+@functools.lru_cache(maxsize=8)
+def _tarja_slab(largura, altura, cor_tarja):
+    """
+    Cria (uma única vez por largura, altura e cor) o bloco de pixels da tarja.
     
-    # Se o último dígito é maior que 7, subtrair até chegar em 7
-    if ultimo_digito > 7:
-        return preco_inteiro - (ultimo_digito - 7)
+    Todas as páginas de um catálogo costumam ter o mesmo tamanho e a mesma
+    cor de tarja, então o mesmo bloco é reaproveitado em todas elas.
     
-    # Se o último dígito é menor que 7, subtrair até o próximo número terminado em 7
-    return preco_inteiro - ultimo_digito - 3
+    Args:
+        largura: Largura da tarja em pixels
+        altura: Altura da tarja em pixels
+        cor_tarja: Tupla RGB para a cor da tarja
+        
+    Returns:
+        Array RGB somente leitura com a tarja preenchida
+    """
+    slab = np.full((altura, largura, 3), cor_tarja, dtype=np.uint8)
+    slab.flags.writeable = False
+    return slab
 
-def adicionar_tarja_cinza(imagem_path, output_path, altura_tarja=300, cor_tarja=(128, 128, 128)):
+def adicionar_tarja_cinza(img, altura_tarja=300, cor_tarja=(128, 128, 128)):
     """
     Adiciona uma tarja colorida sem transparência no rodapé da imagem.
     
     Args:
-        imagem_path: Caminho para a imagem original
-        output_path: Caminho para salvar a imagem com tarja
+        img: Imagem PIL original
         altura_tarja: Altura da tarja em pixels
         cor_tarja: Tupla RGB para a cor da tarja (padrão: cinza)
         
     Returns:
-        Caminho para a imagem com tarja
+        Imagem PIL com tarja
     """
     try:
-        # Abrir a imagem
-        img = Image.open(imagem_path)
-        
-        # Criar uma nova imagem sem transparência
-        tarja = Image.new('RGB', (img.width, altura_tarja), cor_tarja)
-        
-        # Converter a imagem original para RGB se necessário
+        # Converter a imagem para RGB se necessário
         if img.mode != 'RGB':
             img = img.convert('RGB')
         
-        # Criar uma cópia da imagem original
-        img_com_tarja = img.copy()
-        
-        # Colar a tarja no rodapé
-        img_com_tarja.paste(tarja, (0, img.height - altura_tarja))
+        # Copiar os pixels para um array que pode ser alterado
+        arr = np.array(img)
         
-        # Salvar a imagem com tarja
-        img_com_tarja.save(output_path)
+        # Copiar a tarja (em cache) para o rodapé, diretamente no array
+        altura_tarja = min(altura_tarja, arr.shape[0])
+        arr[-altura_tarja:] = _tarja_slab(arr.shape[1], altura_tarja, tuple(cor_tarja))
         
-        return output_path
+        return Image.fromarray(arr, 'RGB')
     except Exception as e:
         raise Exception(f"Erro ao adicionar tarja à imagem: {str(e)}")
 
-def criar_pdf_com_precos(imagens, codigos, produtos_dict, output_path, cor_tarja=(128, 128, 128), progress_callback=None):
+def _codificar_pagina(img_info, cor_tarja=(128, 128, 128)):
+    """
+    Aplica a tarja a uma página e a codifica como JPEG em memória.
+    
+    Args:
+        img_info: Imagem RGB da página, como retornada por extrair_paginas
+        cor_tarja: Tupla RGB para a cor da tarja (padrão: cinza)
+        
+    Returns:
+        Bytes da imagem JPEG
+    """
+    # Montar a imagem diretamente a partir dos bytes RGB da página
+    img = Image.frombytes('RGB', (img_info['largura'], img_info['altura']), img_info['amostras'])
+    
+    # Se não for a primeira página, adicionar tarja colorida
+    # (altura proporcional à resolução em que a página foi renderizada)
+    if img_info['pagina'] > 0:
+        altura_tarja = round(300 * img_info['zoom'] / ZOOM_LAYOUT)
+        img = adicionar_tarja_cinza(img, altura_tarja=altura_tarja, cor_tarja=cor_tarja)
+    
+    # Codificar a imagem em memória
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=88)
+    
+    return buffer.getvalue()
+
+# Marca o fim das páginas na fila entre produtor e consumidor
+_FIM_PAGINAS = object()
+
+def _alimentar_fila(paginas, fila, parar, codificador, cor_tarja):
+    """
+    Produtor da montagem do PDF: consome as páginas extraídas, envia cada uma
+    para ser codificada e a coloca na fila, em ordem.
+    
+    Executada em uma thread separada, para que a extração e a codificação das
+    próximas páginas aconteçam enquanto o FPDF monta as anteriores. A fila é
+    limitada, então a thread bloqueia quando a montagem fica para trás.
+    
+    Args:
+        paginas: Iterável de tuplas (imagem RGB da página, códigos da página)
+        fila: Fila limitada onde as páginas são colocadas
+        parar: Evento sinalizado quando a montagem é interrompida
+        codificador: Pool de threads para aplicar a tarja e codificar as imagens
+        cor_tarja: Tupla RGB para a cor da tarja
+    """
+    paginas = iter(paginas)
+    try:
+        for img_info, codigos_pagina in paginas:
+            if parar.is_set():
+                return
+            futuro = codificador.submit(_codificar_pagina, img_info, cor_tarja)
+            fila.put((img_info, codigos_pagina, futuro))
+        fila.put(_FIM_PAGINAS)
+    except Exception as e:
+        # Repassar o erro para a thread que monta o PDF
+        fila.put(e)
+    finally:
+        # Encerrar a extração (e seu pool de processos) se ela foi interrompida
+        if hasattr(paginas, 'close'):
+            paginas.close()
+
+def criar_pdf_com_precos(paginas, produtos_dict, output_path=None, cor_tarja=(128, 128, 128), progress_callback=None, total_paginas=None):
     """
     Cria um novo PDF com as imagens e preços, usando fonte Arial tamanho 150.
     
+    As páginas são montadas à medida que chegam: extração, tarja e codificação
+    das próximas páginas acontecem em paralelo com a montagem das anteriores.
+    
     Args:
-        imagens: Lista de caminhos para as imagens das páginas
-        codigos: Lista de códigos de produtos com suas páginas
+        paginas: Iterável, em ordem de página, de tuplas (imagem RGB da página,
+            lista de códigos de produtos da página), como gerado por extrair_paginas
         produtos_dict: Dicionário de produtos com códigos como chaves
-        output_path: Caminho para salvar o PDF processado
+        output_path: Caminho para salvar o PDF processado (opcional)
         cor_tarja: Tupla RGB para a cor da tarja (padrão: cinza)
         progress_callback: Função para reportar progresso
+        total_paginas: Número total de páginas, usado para reportar progresso
         
     Returns:
-        Caminho para o PDF processado
+        Conteúdo do PDF processado, em bytes
     """
-    # Criar diretório temporário para imagens processadas
-    temp_dir = os.path.join(os.path.dirname(output_path), "temp_images")
-    os.makedirs(temp_dir, exist_ok=True)
-    
     try:
         # Criar um novo PDF
         pdf = FPDF(unit='pt')
         
-        # Verificar se a fonte Arial está disponível
-        fonte_path = '/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf'
-        if not os.path.exists(fonte_path):
-            # Tentar encontrar uma fonte alternativa
-            fontes_alternativas = [
-                '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
-                '/usr/share/fonts/truetype/freefont/FreeSans.ttf',
-                '/usr/share/fonts/truetype/ubuntu/Ubuntu-R.ttf'
-            ]
-            
-            for fonte_alt in fontes_alternativas:
-                if os.path.exists(fonte_alt):
-                    fonte_path = fonte_alt
-                    break
-            else:
-                # Se nenhuma fonte for encontrada, usar a fonte padrão
-                fonte_path = None
-        
         # Adicionar fonte
-        if fonte_path:
-            pdf.add_font('CustomFont', '', fonte_path, uni=True)
+        if FONTE_PATH:
+            pdf.add_font('CustomFont', '', FONTE_PATH)
             pdf.set_font('CustomFont', '', 30)  # Tamanho 150 (quintuplicado de 30)
         else:
             # Usar fonte padrão se não encontrar a fonte personalizada
             pdf.set_font('Arial', '', 30)
         
-        total_imagens = len(imagens)
-        
-        # Processar cada página
-        for idx, img_info in enumerate(sorted(imagens, key=lambda x: x['pagina'])):
-            page_num = img_info['pagina']
-            img_path = img_info['caminho']
-            
-            if progress_callback:
-                progress_callback(f"Criando página {page_num+1} de {total_imagens}...", 
-                                 0.7 + (idx / total_imagens) * 0.3)  # 70-100% do progresso total
-            
-            # Se não for a primeira página, adicionar tarja colorida
-            if page_num > 0:
-                # Adicionar tarja colorida
-                img_com_tarja_path = os.path.join(temp_dir, f"page_{page_num+1}_tarja.png")
-                img_path = adicionar_tarja_cinza(img_path, img_com_tarja_path, cor_tarja=cor_tarja)
-            
-            # Obter dimensões da imagem
-            img = Image.open(img_path)
-            img_width, img_height = img.size
-            
-            # Adicionar uma nova página com o tamanho da imagem
-            pdf.add_page(format=(img_width, img_height))
-            
-            # Adicionar a imagem como fundo
-            pdf.image(img_path, 0, 0, img_width, img_height)
+        # Fila limitada entre a extração e a montagem: no máximo 8 páginas
+        # aguardando, o que limita o uso de memória
+        fila = queue.Queue(maxsize=8)
+        parar = threading.Event()
+        
+        # Tarja e codificação JPEG liberam o GIL, então são feitas em paralelo
+        # enquanto o FPDF (que não é thread-safe) monta as páginas em ordem
+        with ThreadPoolExecutor(max_workers=4) as codificador:
+            produtor = threading.Thread(
+                target=_alimentar_fila,
+                args=(paginas, fila, parar, codificador, cor_tarja),
+                daemon=True
+            )
+            produtor.start()
             
-            # Adicionar preços para os códigos desta página
-            codigos_pagina = [c for c in codigos if c['pagina'] == page_num]
-            
-            # Distribuir os textos por toda a largura do rodapé
-            if codigos_pagina and page_num > 0:  # Apenas para páginas após a capa
-                # Calcular a largura disponível para texto
-                largura_disponivel = img_width - 100  # Margem de 50px em cada lado
-                
-                # Preparar o texto completo para esta página
-                textos_precos = []
-                
-                for codigo_info in codigos_pagina:
-                    codigo = codigo_info['codigo']
+            try:
+                idx = 0
+                while True:
+                    item = fila.get()
+                    if item is _FIM_PAGINAS:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
                     
-                    # Verificar se este código existe no dicionário de produtos
-                    if codigo in produtos_dict:
-                        # Calcular preço com markup
-                        preco_venda = produtos_dict[codigo]['preco_venda']
-                        
-                        # Arredondar preço para terminar em 7
-                        preco_arredondado = arredondar_preco_para_terminar_em_7(preco_venda)
-                        
-                        # Formatar preço
-                        texto_preco = f"{codigo_info['texto_completo']} - R$ {preco_arredondado}"
-                        textos_precos.append(texto_preco)
-                
-                # Se temos textos para exibir
-                if textos_precos:
-                    # Juntar os textos com espaçamento
-                    texto_completo = "   |   ".join(textos_precos)
+                    img_info, codigos_pagina, futuro = item
+                    jpeg_bytes = futuro.result()
+                    page_num = img_info['pagina']
+                    idx += 1
+                    
+                    # Tamanho da página em pontos, independente da resolução da imagem
+                    escala = ZOOM_LAYOUT / img_info['zoom']
+                    img_width, img_height = img_info['largura'] * escala, img_info['altura'] * escala
+                    
+                    if progress_callback and total_paginas:
+                        progress_callback(f"Criando página {page_num+1} de {total_paginas}...", 
+                                         0.1 + (idx / total_paginas) * 0.9)  # 10-100% do progresso total
+                    
+                    # Adicionar uma nova página com o tamanho da imagem
+                    pdf.add_page(format=(img_width, img_height))
                     
-                    # Posição do texto - centralizado no rodapé
-                    x_pos = 50  # Margem esquerda
-                    y_pos = img_height - 200  # Posição Y no rodapé (centralizado na tarja)
+                    # Adicionar a imagem como fundo
+                    pdf.image(io.BytesIO(jpeg_bytes), 0, 0, img_width, img_height)
                     
-                    # Adicionar texto com preço
-                    pdf.set_xy(x_pos, y_pos)
-                    pdf.set_text_color(255, 255, 255)  # Branco para contrastar com a tarja
+                    # Adicionar preços para os códigos desta página, descartando
+                    # repetições do mesmo código com o mesmo texto
+                    codigos_unicos = {}
+                    for codigo_info in codigos_pagina:
+                        codigos_unicos.setdefault((codigo_info['codigo'], codigo_info['texto_completo']), codigo_info)
+                    codigos_pagina = list(codigos_unicos.values())
                     
-                    # Usar multi_cell com tratamento de erros
+                    # Distribuir os textos por toda a largura do rodapé
+                    if codigos_pagina and page_num > 0:  # Apenas para páginas após a capa
+                        # Calcular a largura disponível para texto
+                        largura_disponivel = img_width - 100  # Margem de 50px em cada lado
+                        
+                        # Preparar o texto completo para esta página
+                        textos_precos = []
+                        
+                        for codigo_info in codigos_pagina:
+                            codigo = codigo_info['codigo']
+                            
+                            # Verificar se este código existe no dicionário de produtos
+                            if codigo in produtos_dict:
+                                # Preço com markup, já arredondado para terminar em 7
+                                preco_arredondado = produtos_dict[codigo]['preco_arredondado']
+                                
+                                # Formatar preço
+                                texto_preco = f"{codigo_info['texto_completo']} - R$ {preco_arredondado}"
+                                textos_precos.append(texto_preco)
+                        
+                        # Se temos textos para exibir
+                        if textos_precos:
+                            # Juntar os textos com espaçamento
+                            texto_completo = "   |   ".join(textos_precos)
+                            
+                            # Posição do texto - centralizado no rodapé
+                            x_pos = 50  # Margem esquerda
+                            y_pos = img_height - 200  # Posição Y no rodapé (centralizado na tarja)
+                            
+                            # Adicionar texto com preço
+                            pdf.set_xy(x_pos, y_pos)
+                            pdf.set_text_color(255, 255, 255)  # Branco para contrastar com a tarja
+                            
+                            # Usar multi_cell com tratamento de erros
+                            try:
+                                pdf.multi_cell(largura_disponivel, 80, texto_completo)  # Altura de linha 80 para espaçamento adequado
+                            except Exception as e:
+                                logger.warning("Erro ao adicionar texto à página %d: %s", page_num + 1, e)
+                                # Tentar uma abordagem alternativa
+                                try:
+                                    # Dividir o texto em partes menores se for muito longo
+                                    partes_texto = texto_completo.split('|')
+                                    for i, parte in enumerate(partes_texto):
+                                        if parte.strip():
+                                            pdf.set_xy(x_pos, y_pos + i * 40)
+                                            pdf.cell(largura_disponivel, 40, parte.strip())
+                                except Exception as e2:
+                                    logger.exception("Erro na abordagem alternativa; preços da página %d podem estar faltando: %s", page_num + 1, e2)
+            
+            finally:
+                # Interromper o produtor se a montagem terminou antes (por erro)
+                # e liberar a fila para que ele não fique bloqueado
+                parar.set()
+                while produtor.is_alive():
                     try:
-                        pdf.multi_cell(largura_disponivel, 80, texto_completo)  # Altura de linha 80 para espaçamento adequado
-                    except Exception as e:
-                        print(f"Erro ao adicionar texto à página {page_num+1}: {str(e)}")
-                        # Tentar uma abordagem alternativa
-                        try:
-                            # Dividir o texto em partes menores se for muito longo
-                            partes_texto = texto_completo.split('|')
-                            for i, parte in enumerate(partes_texto):
-                                if parte.strip():
-                                    pdf.set_xy(x_pos, y_pos + i * 40)
-                                    pdf.cell(largura_disponivel, 40, parte.strip())
-                        except Exception as e2:
-                            print(f"Erro na abordagem alternativa: {str(e2)}")
-        
-        # Salvar o PDF
-        pdf.output(output_path)
-        
-        return output_path
+                        fila.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+                produtor.join()
+        
+        # Gerar o PDF em memória e, se pedido, salvá-lo em disco
+        pdf_bytes = bytes(pdf.output())
+        if output_path:
+            os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+            with open(output_path, 'wb') as f:
+                f.write(pdf_bytes)
+        
+        return pdf_bytes
     
     except Exception as e:
         raise Exception(f"Erro ao criar PDF com preços: {str(e)}\n{traceback.format_exc()}")
-    
-    finally:
-        # Limpar arquivos temporários
-        try:
-            if os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir, ignore_errors=True)
-        except Exception as cleanup_error:
-            print(f"Aviso: Não foi possível limpar todos os arquivos temporários. {str(cleanup_error)}")
 
-def processar_pdf_com_markup(pdf_path, excel_path, output_path, markup=2.0, cor_tarja=(128, 128, 128), progress_callback=None):
+def processar_pdf_com_markup(pdf, excel, output_path=None, markup=2.0, cor_tarja=(128, 128, 128), progress_callback=None, zoom=ZOOM_PADRAO):
     """
     Processa um arquivo PDF, adiciona preços com markup e gera um novo PDF.
     Extrai apenas as imagens do PDF, ignorando completamente a camada de texto.
     
     Args:
-        pdf_path: Caminho para o arquivo PDF original
-        excel_path: Caminho para o arquivo Excel com preços
-        output_path: Caminho para salvar o PDF processado
+        pdf: Caminho para o arquivo PDF original ou seu conteúdo em bytes
+        excel: Caminho para o arquivo Excel com preços ou seu conteúdo em bytes
+        output_path: Caminho para salvar o PDF processado (opcional)
         markup: Valor do markup a ser aplicado
         cor_tarja: Tupla RGB para a cor da tarja (padrão: cinza)
         progress_callback: Função para reportar progresso
+        zoom: Fator de ampliação da renderização (qualidade das imagens)
         
     Returns:
-        Número de produtos processados
+        Tupla (número de produtos processados, conteúdo do PDF processado em bytes)
     """
-    # Criar diretório temporário para extração
-    temp_dir = os.path.join(os.path.dirname(output_path), "temp_extraction")
-    os.makedirs(temp_dir, exist_ok=True)
-    
     try:
-        # 1. Extrair imagens do PDF
+        # 1. Ler preços do Excel (rápido, feito antes para que cada página
+        #    possa ser montada assim que for extraída)
         if progress_callback:
-            progress_callback("Extraindo imagens do PDF...", 0.05)
-        imagens = extrair_imagens_pdf(pdf_path, temp_dir, progress_callback)
+            progress_callback("Lendo preços do Excel...", 0.02)
+        produtos_dict = ler_excel_precos(excel, markup, progress_callback)
         
-        # 2. Extrair códigos de produtos para referência
+        # 2. Extrair imagens e códigos de produtos do PDF e, em paralelo,
+        #    criar o novo PDF com preços
         if progress_callback:
-            progress_callback("Extraindo códigos de produtos...", 0.35)
-        codigos = extrair_codigos_produtos(pdf_path, progress_callback)
-        print(f"Encontrados {len(codigos)} códigos de produtos no PDF")
+            progress_callback("Extraindo páginas e criando novo PDF com preços...", 0.1)
+        total_paginas = contar_paginas(pdf)
         
-        # 3. Ler preços do Excel
-        if progress_callback:
-            progress_callback("Lendo preços do Excel...", 0.55)
-        produtos_dict = ler_excel_precos(excel_path, markup, progress_callback)
+        codigos_encontrados = 0
+        produtos_processados = 0
         
-        # 4. Criar novo PDF com preços
-        if progress_callback:
-            progress_callback("Criando novo PDF com preços...", 0.7)
-        criar_pdf_com_precos(imagens, codigos, produtos_dict, output_path, cor_tarja, progress_callback)
+        def paginas_extraidas():
+            nonlocal codigos_encontrados, produtos_processados
+            for img_info, codigos_pagina in extrair_paginas(pdf, zoom=zoom, total_paginas=total_paginas):
+                codigos_encontrados += len(codigos_pagina)
+                
+                # Manter apenas os códigos com preço na planilha, antes da montagem
+                codigos_pagina = [c for c in codigos_pagina if c['codigo'] in produtos_dict]
+                
+                # Contar produtos processados
+                produtos_processados += len(codigos_pagina)
+                yield img_info, codigos_pagina
+        
+        pdf_bytes = criar_pdf_com_precos(paginas_extraidas(), produtos_dict, output_path, cor_tarja, progress_callback, total_paginas)
         
-        # Contar produtos processados
-        produtos_processados = sum(1 for c in codigos if c['codigo'] in produtos_dict)
-        print(f"Processados {produtos_processados} produtos com sucesso!")
+        logger.info("Encontrados %d códigos de produtos no PDF", codigos_encontrados)
+        logger.info("Processados %d produtos com sucesso!", produtos_processados)
         
         if progress_callback:
             progress_callback("Processamento concluído!", 1.0)
         
-        return produtos_processados
+        return produtos_processados, pdf_bytes
     
     except Exception as e:
-        print(f"Erro durante o processamento: {str(e)}")
-        print(traceback.format_exc())
+        logger.exception("Erro durante o processamento: %s", e)
         raise
-    
-    finally:
-        # Limpar arquivos temporários
-        try:
-            if os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir, ignore_errors=True)
-        except Exception as cleanup_error:
-            print(f"Aviso: Não foi possível limpar todos os arquivos temporários. {str(cleanup_error)}")
 
 # Teste da função
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    
     pdf_path = "/home/ubuntu/upload/Lucboo_BOY+BABY_PRV_26.pdf"
     excel_path = "/home/ubuntu/upload/TABELA DE PREÇO PRIMAVERA VERAO 2026 LUC.BOO (1).xlsx"
     output_path = "/home/ubuntu/pdf_final/catalogo_com_precos.pdf"